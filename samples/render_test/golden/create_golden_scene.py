@@ -11,10 +11,12 @@ Usage:
 """
 
 import bpy
+import bmesh
 import math
 import sys
 import os
-from mathutils import Vector
+import numpy as np
+from mathutils import Matrix, Vector
 
 # ---------------------------------------------------------------------------
 # Coordinate conversion: Engine (Y-up, right-handed) -> Blender (Z-up, right-handed)
@@ -30,39 +32,57 @@ def e2b_scale(sx, sy, sz):
 def e2b_dir(dx, dy, dz):
     return (dx, -dz, dy)
 
+# The position basis change as a matrix, for converting (N, 3) batches in one matmul
+E2B_POS = np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]], dtype=np.float64)
+
+def e2b_pos_batch(positions):
+    return np.asarray(positions, dtype=np.float64) @ E2B_POS.T
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
+def srgb_to_linear(rgb):
+    # 8-bit sRGB channels -> linear floats, all channels in one vectorized pass
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    return tuple(np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4).tolist())
+
 def clear_scene():
-    bpy.ops.object.select_all(action='SELECT')
-    bpy.ops.object.delete(use_global=False)
-    for block in [bpy.data.meshes, bpy.data.materials, bpy.data.cameras,
-                  bpy.data.lights, bpy.data.images]:
-        for item in block:
-            block.remove(item)
+    blocks = [bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.cameras,
+              bpy.data.lights, bpy.data.images]
+    try:
+        # Single C-level removal, no operator calls or per-item depsgraph updates
+        bpy.data.batch_remove(ids=[item for block in blocks for item in block])
+    except AttributeError:
+        # Older Blender without batch_remove
+        bpy.ops.object.select_all(action='SELECT')
+        bpy.ops.object.delete(use_global=False)
+        for block in blocks[1:]:
+            for item in block:
+                block.remove(item)
 
 def create_pbr_material(name, base_color, metallic=0.0, roughness=0.5,
                         emission=(0, 0, 0), emission_strength=1.0, alpha=1.0):
     mat = bpy.data.materials.new(name=name)
     mat.use_nodes = True
-    nodes = mat.node_tree.nodes
-    bsdf = nodes.get("Principled BSDF")
+    # The default node tree has a single Principled BSDF; match it by type, not name
+    bsdf = next(n for n in mat.node_tree.nodes if n.type == 'BSDF_PRINCIPLED')
+    inputs = bsdf.inputs
 
-    bsdf.inputs["Base Color"].default_value = (*base_color, 1.0)
-    bsdf.inputs["Metallic"].default_value = metallic
-    bsdf.inputs["Roughness"].default_value = roughness
+    inputs["Base Color"].default_value = (*base_color, 1.0)
+    inputs["Metallic"].default_value = metallic
+    inputs["Roughness"].default_value = roughness
 
     if any(c > 0 for c in emission):
-        bsdf.inputs["Emission Color"].default_value = (*emission, 1.0)
-        bsdf.inputs["Emission Strength"].default_value = emission_strength
+        inputs["Emission Color"].default_value = (*emission, 1.0)
+        inputs["Emission Strength"].default_value = emission_strength
 
     if alpha < 1.0:
         mat.use_backface_culling = False
-        bsdf.inputs["Alpha"].default_value = alpha
+        inputs["Alpha"].default_value = alpha
         # Transmission gives a more physically-correct glass look
-        bsdf.inputs["Transmission Weight"].default_value = 1.0 - alpha
-        bsdf.inputs["IOR"].default_value = 1.45
+        inputs["Transmission Weight"].default_value = 1.0 - alpha
+        inputs["IOR"].default_value = 1.45
 
     return mat
 
@@ -84,6 +104,28 @@ def add_sphere(name, location, radius_scale, material, segments=64, rings=32):
     obj.data.materials.append(material)
     return obj
 
+def add_sphere_grid(name, locations, radius, materials, segments=64, rings=32):
+    # Builds every sphere into a single mesh (one material slot per sphere) with
+    # bmesh, instead of paying a bpy.ops call and depsgraph update per sphere.
+    bm = bmesh.new()
+    for index, location in enumerate(locations):
+        verts = bmesh.ops.create_uvsphere(
+            bm, u_segments=segments, v_segments=rings, radius=radius,
+            matrix=Matrix.Translation(location), calc_uvs=True)["verts"]
+        for face in {f for v in verts for f in v.link_faces}:
+            face.material_index = index
+            face.smooth = True
+
+    mesh = bpy.data.meshes.new(name)
+    bm.to_mesh(mesh)
+    bm.free()
+    for material in materials:
+        mesh.materials.append(material)
+
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.collection.objects.link(obj)
+    return obj
+
 # ---------------------------------------------------------------------------
 # Scene construction (mirrors samples/render_test/src/main.cpp exactly)
 # ---------------------------------------------------------------------------
@@ -146,6 +188,7 @@ def build_scene():
     SPACING = 2.0
     START = -(GRID - 1) * SPACING * 0.5
 
+    grid_materials = []
     for ix in range(GRID):
         for iz in range(GRID):
             metallic = ix / (GRID - 1)
@@ -156,15 +199,17 @@ def build_scene():
             else:
                 albedo = (0.9, 0.1, 0.1)     # Red dielectric
 
-            mat = create_pbr_material(
-                f"PBR_{ix}_{iz}", albedo, metallic=metallic, roughness=roughness)
+            grid_materials.append(create_pbr_material(
+                f"PBR_{ix}_{iz}", albedo, metallic=metallic, roughness=roughness))
 
-            ex = START + ix * SPACING
-            ez = START + iz * SPACING
-            # Engine: position (ex, 1.0, ez), scale (0.8, 0.8, 0.8)
-            add_sphere(f"PBRSphere_{ix}_{iz}",
-                       e2b_pos(ex, 1.0, ez),
-                       e2b_scale(0.8, 0.8, 0.8), mat)
+    # Engine: position (START + ix * SPACING, 1.0, START + iz * SPACING), scale (0.8, 0.8, 0.8)
+    # ix-major order, matching the materials above
+    offsets = START + np.arange(GRID) * SPACING
+    ex, ez = np.meshgrid(offsets, offsets, indexing='ij')
+    grid_positions = np.stack([ex, np.ones_like(ex), ez], axis=-1).reshape(-1, 3)
+    grid_locations = e2b_pos_batch(grid_positions).tolist()
+
+    add_sphere_grid("PBRSpheres", grid_locations, 0.8, grid_materials)
 
     # ===== Shadow Casters (tall cubes) =====
     # Engine: albedo (0.3, 0.3, 0.35), roughness 0.6
@@ -238,17 +283,12 @@ def configure_render():
     # --- Output ---
     scene.render.image_settings.file_format = 'PNG'
     scene.render.image_settings.color_depth = '8'
+    scene.render.image_settings.color_mode = 'RGB'  # No alpha; compared as RGB anyway
 
     # --- World background ---
     # Engine clear_color: 0x1a1a2eFF = sRGB(26, 26, 46)
     # Convert to linear: sRGB_to_linear(x/255)
-    def srgb_to_linear(c):
-        c = c / 255.0
-        return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
-
-    bg_r = srgb_to_linear(0x1a)
-    bg_g = srgb_to_linear(0x1a)
-    bg_b = srgb_to_linear(0x2e)
+    bg_r, bg_g, bg_b = srgb_to_linear((0x1a, 0x1a, 0x2e))
 
     world = bpy.data.worlds.get("World")
     if not world:
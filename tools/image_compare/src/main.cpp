@@ -1,6 +1,7 @@
 // image_compare — per-pixel RMSE comparison of two PNG images
-// Usage: image_compare <golden.png> <test.png> [--threshold=0.01] [--diff=diff.png]
-// Exit code 0 = pass (RMSE <= threshold), 1 = fail or error
+// Usage: image_compare <golden.png> <test.png> [<golden.png> <test.png> ...] [--pairs=pairs.txt]
+//                      [--threshold=0.01] [--diff=diff.png] [--early-exit] [--cache-golden]
+// Exit code 0 = every pair passes (RMSE <= threshold), 1 = any fail or error
 
 #define STB_IMAGE_IMPLEMENTATION
 #include <stb_image.h>
@@ -12,104 +13,588 @@
 #endif
 #include <stb_image_write.h>
 
+#if defined(_WIN32)
+#include <process.h>
+#else
+#include <unistd.h>
+#endif
+
+#if defined(__SSE2__) || defined(_M_X64) || (defined(_M_IX86_FP) && _M_IX86_FP >= 2)
+#define IMAGE_COMPARE_SSE2 1
+#include <emmintrin.h>
+#elif defined(__aarch64__) || defined(_M_ARM64)
+#define IMAGE_COMPARE_NEON 1
+#include <arm_neon.h>
+#endif
+
+#include <algorithm>
+#include <atomic>
 #include <cmath>
+#include <cstdarg>
+#include <cstdint>
 #include <cstdio>
 #include <cstdlib>
 #include <cstring>
+#include <filesystem>
+#include <fstream>
+#include <memory>
+#include <sstream>
 #include <string>
+#include <thread>
 #include <vector>
 
-static void print_usage() {
-    std::fprintf(stderr, "Usage: image_compare <golden.png> <test.png> [--threshold=0.01] [--diff=diff.png]\n");
+// Pixels per memcmp/diff stripe: at most 64 KB per image, so a golden/test pair fits in L2
+static constexpr size_t STRIPE_PIXELS = 16384;
+
+// The squared RGB error of a whole stripe fits in 32 bits, so stripes reduce in uint32
+static_assert(STRIPE_PIXELS * 3 * 255 * 255 <= UINT32_MAX, "stripe sum must fit in uint32_t");
+
+// Decoded pixels are used in place straight from stb_image (or a golden sidecar, which
+// is malloc'd); nothing mutates them.
+struct PixelDeleter {
+    void (*release)(void*) = stbi_image_free;
+    void operator()(const unsigned char* p) const { release(const_cast<unsigned char*>(p)); }
+};
+using ImagePixels = std::unique_ptr<const unsigned char[], PixelDeleter>;
+
+// Reads a whole encoded image; leaves data empty on failure or if stb_image could not
+// take its size (stb's memory API uses int lengths)
+static void read_file(const char* path, std::vector<unsigned char>& data) {
+    data.clear();
+    std::ifstream file(path, std::ios::binary | std::ios::ate);
+    if (!file) return;
+    const std::streamoff size = file.tellg();
+    if (size <= 0 || size > INT32_MAX) return;
+    data.resize(static_cast<size_t>(size));
+    file.seekg(0);
+    if (!file.read(reinterpret_cast<char*>(data.data()), size)) {
+        data.clear();
+    }
 }
 
-int main(int argc, char** argv) {
-    if (argc < 3) {
-        print_usage();
-        return 1;
+static unsigned char* decode_image(const std::vector<unsigned char>& data, int& width, int& height,
+                                   int& native_channels, int channels) {
+    if (data.empty()) return nullptr;
+    return stbi_load_from_memory(data.data(), static_cast<int>(data.size()), &width, &height,
+                                 &native_channels, channels);
+}
+
+// --cache-golden keeps the decoded golden next to it as "<golden>.decoded": this header
+// followed by the raw interleaved pixels. It is trusted only when the golden's size and
+// exact modification time still match the ones recorded when it was decoded (an older
+// or copied-in golden must not reuse stale pixels), and it holds the same dimensions
+// and channel count being requested.
+struct SidecarHeader {
+    char magic[4];
+    uint32_t width;
+    uint32_t height;
+    uint32_t channels;
+    uint64_t golden_size;
+    int64_t golden_mtime;
+};
+static constexpr char SIDECAR_MAGIC[4] = {'I', 'C', 'P', '2'};
+
+// Identifies one version of the golden file on disk
+struct FileStamp {
+    uint64_t size = 0;
+    int64_t mtime = 0;
+};
+
+static bool stamp_file(const std::string& path, FileStamp& stamp) {
+    namespace fs = std::filesystem;
+    std::error_code ec;
+    const uintmax_t size = fs::file_size(path, ec);
+    if (ec) return false;
+    const auto mtime = fs::last_write_time(path, ec);
+    if (ec) return false;
+    stamp.size = static_cast<uint64_t>(size);
+    stamp.mtime = static_cast<int64_t>(mtime.time_since_epoch().count());
+    return true;
+}
+
+static ImagePixels load_golden_sidecar(const std::string& golden_path, const FileStamp& golden_stamp,
+                                       int channels, int width, int height) {
+    std::ifstream file(golden_path + ".decoded", std::ios::binary);
+    SidecarHeader header{};
+    if (!file.read(reinterpret_cast<char*>(&header), sizeof(header)) ||
+        std::memcmp(header.magic, SIDECAR_MAGIC, sizeof(SIDECAR_MAGIC)) != 0 ||
+        header.golden_size != golden_stamp.size || header.golden_mtime != golden_stamp.mtime ||
+        header.channels != static_cast<uint32_t>(channels) || width <= 0 || height <= 0 ||
+        header.width != static_cast<uint32_t>(width) || header.height != static_cast<uint32_t>(height)) {
+        return {};
+    }
+
+    const size_t size = static_cast<size_t>(header.width) * header.height * header.channels;
+    ImagePixels pixels(static_cast<unsigned char*>(std::malloc(size)), PixelDeleter{std::free});
+    if (!pixels || !file.read(reinterpret_cast<char*>(const_cast<unsigned char*>(pixels.get())),
+                              static_cast<std::streamsize>(size))) {
+        return {};
     }
+    return pixels;
+}
+
+static long current_process_id() {
+#if defined(_WIN32)
+    return static_cast<long>(_getpid());
+#else
+    return static_cast<long>(getpid());
+#endif
+}
+
+// Writes through a per-process, per-thread temp file and renames it into place, so pairs
+// and concurrent runs sharing a golden can refresh the sidecar without exposing a
+// partial file. golden_stamp must be taken before the golden was read.
+static void write_golden_sidecar(const std::string& golden_path, const FileStamp& golden_stamp,
+                                 const unsigned char* pixels, int width, int height, int channels) {
+    namespace fs = std::filesystem;
+    const fs::path sidecar_path = golden_path + ".decoded";
+    const fs::path temp_path = golden_path + ".decoded." + std::to_string(current_process_id()) + "." +
+        std::to_string(std::hash<std::thread::id>{}(std::this_thread::get_id())) + ".tmp";
+
+    SidecarHeader header{};
+    std::memcpy(header.magic, SIDECAR_MAGIC, sizeof(SIDECAR_MAGIC));
+    header.width = static_cast<uint32_t>(width);
+    header.height = static_cast<uint32_t>(height);
+    header.channels = static_cast<uint32_t>(channels);
+    header.golden_size = golden_stamp.size;
+    header.golden_mtime = golden_stamp.mtime;
+    const size_t size = static_cast<size_t>(width) * static_cast<size_t>(height) * static_cast<size_t>(channels);
+    {
+        std::ofstream file(temp_path, std::ios::binary | std::ios::trunc);
+        if (!file.write(reinterpret_cast<const char*>(&header), sizeof(header)) ||
+            !file.write(reinterpret_cast<const char*>(pixels), static_cast<std::streamsize>(size))) {
+            file.close();
+            std::error_code ec;
+            fs::remove(temp_path, ec);
+            return;
+        }
+    }
+    std::error_code ec;
+    fs::rename(temp_path, sidecar_path, ec);
+    if (ec) {
+        fs::remove(temp_path, ec);
+    }
+}
 
-    const char* golden_path = argv[1];
-    const char* test_path = argv[2];
+// SIMD sum of squared RGB differences over pixels [begin, end) of images with 3 or 4
+// interleaved channels, in blocks of three 16-byte vectors (16 RGB or 12 RGBA pixels).
+// |a-b| is formed on bytes (two saturating subtracts / vabd), alpha is masked off for
+// RGBA, and the squares are widened and summed in 32-bit lanes that are flushed to the
+// 64-bit total before they can overflow. Returns the pixel index where the vector loop
+// stopped; the caller finishes the tail.
+static size_t accumulate_sq_diff_simd(const unsigned char* golden, const unsigned char* test,
+                                      size_t channels, size_t begin, size_t end, uint64_t& sum_sq) {
+    constexpr size_t block_bytes = 48;
+    // Each lane gains at most 12 * 255^2 per block, so 4096 blocks stay below 2^32
+    constexpr size_t blocks_per_flush = 4096;
+    const size_t pixels_per_block = block_bytes / channels;
+    size_t i = begin;
+#if defined(IMAGE_COMPARE_SSE2)
+    const __m128i rgb_mask = _mm_set1_epi32(channels == 4 ? 0x00FFFFFF : -1);
+    const __m128i zero = _mm_setzero_si128();
+    while (end - i >= pixels_per_block) {
+        __m128i acc = _mm_setzero_si128();
+        size_t blocks = std::min(blocks_per_flush, (end - i) / pixels_per_block);
+        for (size_t b = 0; b < blocks; ++b, i += pixels_per_block) {
+            const unsigned char* gp = golden + i * channels;
+            const unsigned char* tp = test + i * channels;
+            for (size_t v = 0; v < block_bytes; v += 16) {
+                __m128i g = _mm_loadu_si128(reinterpret_cast<const __m128i*>(gp + v));
+                __m128i t = _mm_loadu_si128(reinterpret_cast<const __m128i*>(tp + v));
+                __m128i d = _mm_or_si128(_mm_subs_epu8(g, t), _mm_subs_epu8(t, g));
+                d = _mm_and_si128(d, rgb_mask);
+                __m128i d_lo = _mm_unpacklo_epi8(d, zero);
+                __m128i d_hi = _mm_unpackhi_epi8(d, zero);
+                acc = _mm_add_epi32(acc, _mm_madd_epi16(d_lo, d_lo));
+                acc = _mm_add_epi32(acc, _mm_madd_epi16(d_hi, d_hi));
+            }
+        }
+        alignas(16) uint32_t lanes[4];
+        _mm_store_si128(reinterpret_cast<__m128i*>(lanes), acc);
+        sum_sq += static_cast<uint64_t>(lanes[0]) + lanes[1] + lanes[2] + lanes[3];
+    }
+#elif defined(IMAGE_COMPARE_NEON)
+    const uint8x16_t rgb_mask = vreinterpretq_u8_u32(vdupq_n_u32(channels == 4 ? 0x00FFFFFFu : 0xFFFFFFFFu));
+    while (end - i >= pixels_per_block) {
+        uint32x4_t acc = vdupq_n_u32(0);
+        size_t blocks = std::min(blocks_per_flush, (end - i) / pixels_per_block);
+        for (size_t b = 0; b < blocks; ++b, i += pixels_per_block) {
+            const unsigned char* gp = golden + i * channels;
+            const unsigned char* tp = test + i * channels;
+            for (size_t v = 0; v < block_bytes; v += 16) {
+                uint8x16_t g = vld1q_u8(gp + v);
+                uint8x16_t t = vld1q_u8(tp + v);
+                uint8x16_t d = vandq_u8(vabdq_u8(g, t), rgb_mask);
+                acc = vpadalq_u16(acc, vmull_u8(vget_low_u8(d), vget_low_u8(d)));
+                acc = vpadalq_u16(acc, vmull_u8(vget_high_u8(d), vget_high_u8(d)));
+            }
+        }
+        sum_sq += vaddlvq_u32(acc);
+    }
+#else
+    (void)golden;
+    (void)test;
+    (void)end;
+    (void)pixels_per_block;
+    (void)blocks_per_flush;
+    (void)sum_sq;
+#endif
+    return i;
+}
+
+static inline uint32_t abs_diff(unsigned char a, unsigned char b) {
+    return a > b ? static_cast<uint32_t>(a - b) : static_cast<uint32_t>(b - a);
+}
+
+static inline unsigned char amplify_diff(uint32_t d) {
+    return static_cast<unsigned char>(std::min<uint32_t>(d * 10, 255));
+}
+
+// Sum of squared RGB differences over pixels [begin, end), optionally writing the
+// 10x amplified diff visualization (always RGBA). Each pixel is read once and nothing
+// else is materialized, so ranges can be processed independently.
+static uint64_t accumulate_stripe(const unsigned char* golden, const unsigned char* test, size_t channels,
+                                  unsigned char* diff, size_t begin, size_t end) {
+    uint64_t sum_sq = 0;
+    if (!diff) {
+        begin = accumulate_sq_diff_simd(golden, test, channels, begin, end, sum_sq);
+    }
+    uint32_t stripe_sum_sq = 0;  // end - begin <= STRIPE_PIXELS
+    for (size_t i = begin; i < end; ++i) {
+        const unsigned char* g = golden + i * channels;
+        const unsigned char* t = test + i * channels;
+        // Compare RGB only
+        const uint32_t d0 = abs_diff(g[0], t[0]);
+        const uint32_t d1 = abs_diff(g[1], t[1]);
+        const uint32_t d2 = abs_diff(g[2], t[2]);
+        stripe_sum_sq += d0 * d0 + d1 * d1 + d2 * d2;
+        if (diff) {
+            // 10x amplified diff for visualization, full alpha
+            const unsigned char pixel[4] = {amplify_diff(d0), amplify_diff(d1), amplify_diff(d2), 255};
+            std::memcpy(diff + i * 4, pixel, sizeof(pixel));
+        }
+    }
+    return sum_sq + stripe_sum_sq;
+}
+
+// Walks [begin, end) in stripes small enough that a golden/test stripe pair stays
+// resident in L2: each stripe is memcmp'd first and only diffed (while still hot)
+// when it differs. Identical stripes just get a black diff. Stripe sums go into the
+// shared running total; once it exceeds stop_above the result can only be a FAIL,
+// so the remaining stripes are skipped and skipped is set.
+static void accumulate_diff(const unsigned char* golden, const unsigned char* test, size_t channels,
+                            unsigned char* diff, size_t begin, size_t end,
+                            std::atomic<uint64_t>& running_sum, uint64_t stop_above,
+                            std::atomic<bool>& skipped) {
+    for (size_t stripe = begin; stripe < end; stripe += STRIPE_PIXELS) {
+        if (running_sum.load(std::memory_order_relaxed) > stop_above) {
+            skipped.store(true, std::memory_order_relaxed);
+            return;
+        }
+        size_t stripe_end = std::min(end, stripe + STRIPE_PIXELS);
+        if (std::memcmp(golden + stripe * channels, test + stripe * channels, (stripe_end - stripe) * channels) == 0) {
+            if (diff) {
+                for (size_t i = stripe; i < stripe_end; ++i) {
+                    diff[i * 4 + 0] = 0;  // Black diff, full alpha
+                    diff[i * 4 + 1] = 0;
+                    diff[i * 4 + 2] = 0;
+                    diff[i * 4 + 3] = 255;
+                }
+            }
+            continue;
+        }
+        running_sum.fetch_add(accumulate_stripe(golden, test, channels, diff, stripe, stripe_end),
+                              std::memory_order_relaxed);
+    }
+}
+
+struct CompareOptions {
     float threshold = 0.01f;
     std::string diff_path;
+    bool early_exit = false;
+    bool cache_golden = false;
+};
 
-    // Parse optional args
-    for (int i = 3; i < argc; ++i) {
-        if (std::strncmp(argv[i], "--threshold=", 12) == 0) {
-            threshold = std::strtof(argv[i] + 12, nullptr);
-        } else if (std::strncmp(argv[i], "--diff=", 7) == 0) {
-            diff_path = argv[i] + 7;
+struct ImagePair {
+    std::string golden_path;
+    std::string test_path;
+};
+
+// Report text is buffered per pair so pairs compared in parallel still print in order
+struct PairResult {
+    bool pass = false;
+    std::string output;
+    std::string errors;
+};
+
+static void append_format(std::string& out, const char* format, ...) {
+    va_list args;
+    va_start(args, format);
+    va_list args_copy;
+    va_copy(args_copy, args);
+    int length = std::vsnprintf(nullptr, 0, format, args_copy);
+    va_end(args_copy);
+    if (length > 0) {
+        size_t offset = out.size();
+        out.resize(offset + static_cast<size_t>(length) + 1);
+        std::vsnprintf(out.data() + offset, static_cast<size_t>(length) + 1, format, args);
+        out.resize(offset + static_cast<size_t>(length));
+    }
+    va_end(args);
+}
+
+static void print_usage() {
+    std::fprintf(stderr, "Usage: image_compare <golden.png> <test.png> [<golden.png> <test.png> ...] [--pairs=pairs.txt]\n"
+                         "                     [--threshold=0.01] [--diff=diff.png] [--early-exit] [--cache-golden]\n");
+}
+
+// Reads "<golden> <test>" lines; blank lines and lines starting with '#' are skipped
+static bool read_pairs_file(const char* path, std::vector<ImagePair>& pairs) {
+    std::ifstream file(path);
+    if (!file) {
+        std::fprintf(stderr, "Error: cannot open pairs file '%s'\n", path);
+        return false;
+    }
+    std::string line;
+    int line_number = 0;
+    while (std::getline(file, line)) {
+        ++line_number;
+        std::istringstream fields(line);
+        ImagePair pair;
+        if (!(fields >> pair.golden_path) || pair.golden_path[0] == '#') {
+            continue;
         }
+        if (!(fields >> pair.test_path)) {
+            std::fprintf(stderr, "Error: %s:%d: expected '<golden> <test>'\n", path, line_number);
+            return false;
+        }
+        pairs.push_back(std::move(pair));
+    }
+    return true;
+}
+
+// Compares one golden/test pair, using up to max_workers threads for the pixel pass,
+// and records its RMSE line prefixed with label. Load errors and size mismatches
+// count as failures.
+static PairResult compare_pair(const ImagePair& pair, const CompareOptions& options, const char* label,
+                               size_t max_workers) {
+    PairResult result;
+    const char* golden_path = pair.golden_path.c_str();
+    const char* test_path = pair.test_path.c_str();
+
+    // Files are read whole and decoded from memory, so the header probe and the decode
+    // share one read instead of each going through stb_image's small stdio reads. With
+    // --cache-golden the golden PNG is only probed, and read in full if its sidecar is stale.
+    // Its stamp is taken before anything is read, so a sidecar never claims a newer golden
+    // than the pixels it holds.
+    std::vector<unsigned char> golden_file;
+    std::vector<unsigned char> test_file;
+    FileStamp golden_stamp;
+    bool golden_stamped = options.cache_golden && stamp_file(pair.golden_path, golden_stamp);
+    if (!options.cache_golden) {
+        read_file(golden_path, golden_file);
+    }
+    read_file(test_path, test_file);
+
+    // Decode at the native channel count when both images are RGBA; anything else is
+    // decoded as RGB, so an RGB golden is never expanded just to have alpha ignored.
+    int gw = 0, gh = 0, gc = 0;
+    int tw = 0, th = 0, tc = 0;
+    int channels = 3;
+    bool golden_probed = golden_file.empty()
+        ? stbi_info(golden_path, &gw, &gh, &gc) != 0
+        : stbi_info_from_memory(golden_file.data(), static_cast<int>(golden_file.size()), &gw, &gh, &gc) != 0;
+    bool test_probed = !test_file.empty() &&
+        stbi_info_from_memory(test_file.data(), static_cast<int>(test_file.size()), &tw, &th, &tc) != 0;
+    if (golden_probed && test_probed && gc == 4 && tc == 4) {
+        channels = 4;
+    }
+
+    // Images are never resampled to match: differing sizes are an error, caught here from
+    // the headers so neither image is decoded (and checked again after decoding below)
+    if (golden_probed && test_probed && (gw != tw || gh != th)) {
+        append_format(result.errors, "%sError: image dimensions differ — golden %dx%d vs test %dx%d\n",
+                      label, gw, gh, tw, th);
+        return result;
     }
 
     // Load images
-    int gw, gh, gc;
-    unsigned char* golden = stbi_load(golden_path, &gw, &gh, &gc, 4);
-    if (!golden) {
-        std::fprintf(stderr, "Error: cannot load golden image '%s'\n", golden_path);
-        return 1;
+    ImagePixels golden_pixels;
+    if (golden_stamped && golden_probed) {
+        golden_pixels = load_golden_sidecar(pair.golden_path, golden_stamp, channels, gw, gh);
+    }
+    if (options.cache_golden && !golden_pixels) {
+        read_file(golden_path, golden_file);
+    }
+    if (!golden_pixels) {
+        golden_pixels = ImagePixels(decode_image(golden_file, gw, gh, gc, channels));
+        if (!golden_pixels) {
+            append_format(result.errors, "%sError: cannot load golden image '%s'\n", label, golden_path);
+            return result;
+        }
+        if (golden_stamped) {
+            write_golden_sidecar(pair.golden_path, golden_stamp, golden_pixels.get(), gw, gh, channels);
+        }
     }
 
-    int tw, th, tc;
-    unsigned char* test = stbi_load(test_path, &tw, &th, &tc, 4);
-    if (!test) {
-        std::fprintf(stderr, "Error: cannot load test image '%s'\n", test_path);
-        stbi_image_free(golden);
-        return 1;
+    ImagePixels test_pixels(decode_image(test_file, tw, th, tc, channels));
+    if (!test_pixels) {
+        append_format(result.errors, "%sError: cannot load test image '%s'\n", label, test_path);
+        return result;
     }
 
     if (gw != tw || gh != th) {
-        std::fprintf(stderr, "Error: image dimensions differ — golden %dx%d vs test %dx%d\n", gw, gh, tw, th);
-        stbi_image_free(golden);
-        stbi_image_free(test);
-        return 1;
+        append_format(result.errors, "%sError: image dimensions differ — golden %dx%d vs test %dx%d\n",
+                      label, gw, gh, tw, th);
+        return result;
     }
 
+    const unsigned char* golden = golden_pixels.get();
+    const unsigned char* test = test_pixels.get();
+
     // Compute per-pixel RMSE (normalized 0-1)
-    int total_pixels = gw * gh;
-    int channels = 4;
-    double sum_sq = 0.0;
+    // Channel differences stay in 8-bit (|a-b| as max-min, no wrap-around) and the
+    // squares are summed as integers; normalization happens once at the end.
+    size_t total_pixels = static_cast<size_t>(gw) * static_cast<size_t>(gh);
+    size_t pixel_stride = static_cast<size_t>(channels);
 
-    std::vector<unsigned char> diff_data;
-    bool save_diff = !diff_path.empty();
+    // Every diff byte is written by the pass below, so skip the zero-fill
+    std::unique_ptr<unsigned char[]> diff_data;
+    bool save_diff = !options.diff_path.empty();
     if (save_diff) {
-        diff_data.resize(static_cast<size_t>(total_pixels) * 4);
-    }
-
-    for (int i = 0; i < total_pixels; ++i) {
-        int base = i * channels;
-        double pixel_diff_sq = 0.0;
-        for (int c = 0; c < 3; ++c) { // Compare RGB only
-            double d = (static_cast<double>(golden[base + c]) - static_cast<double>(test[base + c])) / 255.0;
-            pixel_diff_sq += d * d;
-            if (save_diff) {
-                // 10x amplified diff for visualization
-                int amplified = static_cast<int>(std::abs(d) * 255.0 * 10.0);
-                if (amplified > 255) amplified = 255;
-                diff_data[base + c] = static_cast<unsigned char>(amplified);
-            }
-        }
-        sum_sq += pixel_diff_sq / 3.0;  // Average across channels
-        if (save_diff) {
-            diff_data[base + 3] = 255;  // Full alpha
+        diff_data = std::make_unique_for_overwrite<unsigned char[]>(total_pixels * 4);
+    }
+    unsigned char* diff = diff_data.get();
+
+    // The comparison fails exactly when sum_sq > (255 * threshold)^2 * 3 * pixels. With
+    // --early-exit (and no diff image to finish) the pass stops as soon as the running
+    // sum crosses that bound, so clearly mismatched images only read a few stripes.
+    uint64_t stop_above = UINT64_MAX;
+    if (options.early_exit && !save_diff) {
+        double budget = 255.0 * static_cast<double>(options.threshold);
+        budget = budget * budget * 3.0 * static_cast<double>(total_pixels);
+        if (budget < 0x1p63) {
+            stop_above = static_cast<uint64_t>(std::max(budget, 0.0));
         }
     }
 
-    double rmse = std::sqrt(sum_sq / static_cast<double>(total_pixels));
+    // Split the pixel range across hardware threads, all adding to one running sum.
+    // Byte-identical images (the common passing case) reduce to one memcmp per stripe.
+    size_t worker_count = std::min(max_workers, std::max<size_t>(1, total_pixels / 65536));
+    std::atomic<uint64_t> running_sum{0};
+    std::atomic<bool> skipped{false};
+    std::vector<std::thread> workers;
+    size_t chunk = (total_pixels + worker_count - 1) / worker_count;
+    for (size_t w = 1; w < worker_count; ++w) {
+        size_t begin = std::min(total_pixels, w * chunk);
+        size_t end = std::min(total_pixels, begin + chunk);
+        workers.emplace_back([&, begin, end] {
+            accumulate_diff(golden, test, pixel_stride, diff, begin, end, running_sum, stop_above, skipped);
+        });
+    }
+    accumulate_diff(golden, test, pixel_stride, diff, 0, std::min(total_pixels, chunk), running_sum, stop_above,
+                    skipped);
+    for (auto& worker : workers) {
+        worker.join();
+    }
+
+    uint64_t sum_sq = running_sum.load();
+    bool over_budget = sum_sq > stop_above;
+    bool stopped_early = skipped.load();
+
+    // Average across channels and pixels, then scale to 0-1
+    // (a lower bound when stripes were skipped)
+    double rmse = std::sqrt(static_cast<double>(sum_sq) / (static_cast<double>(total_pixels) * 3.0)) / 255.0;
 
     // Save diff image if requested
     if (save_diff) {
-        stbi_write_png(diff_path.c_str(), gw, gh, 4, diff_data.data(), gw * 4);
-        std::printf("Diff image saved: %s\n", diff_path.c_str());
+        stbi_write_png(options.diff_path.c_str(), gw, gh, 4, diff, gw * 4);
+        append_format(result.output, "Diff image saved: %s\n", options.diff_path.c_str());
     }
 
     // Report
-    bool pass = rmse <= static_cast<double>(threshold);
-    std::printf("RMSE: %.6f (threshold: %.6f) — %s\n", rmse, static_cast<double>(threshold), pass ? "PASS" : "FAIL");
+    result.pass = !over_budget && rmse <= static_cast<double>(options.threshold);
+    if (stopped_early) {
+        append_format(result.output, "%sRMSE: >= %.6f (threshold: %.6f) — FAIL (early exit)\n",
+                      label, rmse, static_cast<double>(options.threshold));
+    } else {
+        append_format(result.output, "%sRMSE: %.6f (threshold: %.6f) — %s\n",
+                      label, rmse, static_cast<double>(options.threshold), result.pass ? "PASS" : "FAIL");
+    }
+
+    return result;
+}
+
+int main(int argc, char** argv) {
+    CompareOptions options;
+    std::vector<ImagePair> pairs;
+    std::vector<const char*> paths;
 
-    stbi_image_free(golden);
-    stbi_image_free(test);
+    // Parse args: bare arguments are golden/test path pairs, the rest are options
+    for (int i = 1; i < argc; ++i) {
+        if (std::strncmp(argv[i], "--threshold=", 12) == 0) {
+            options.threshold = std::strtof(argv[i] + 12, nullptr);
+        } else if (std::strncmp(argv[i], "--diff=", 7) == 0) {
+            options.diff_path = argv[i] + 7;
+        } else if (std::strcmp(argv[i], "--early-exit") == 0) {
+            options.early_exit = true;
+        } else if (std::strcmp(argv[i], "--cache-golden") == 0) {
+            options.cache_golden = true;
+        } else if (std::strncmp(argv[i], "--pairs=", 8) == 0) {
+            if (!read_pairs_file(argv[i] + 8, pairs)) {
+                return 1;
+            }
+        } else if (std::strncmp(argv[i], "--", 2) != 0) {
+            paths.push_back(argv[i]);
+        }
+    }
+
+    if (paths.size() % 2 != 0) {
+        print_usage();
+        return 1;
+    }
+    for (size_t i = 0; i < paths.size(); i += 2) {
+        pairs.push_back({paths[i], paths[i + 1]});
+    }
+    if (pairs.empty()) {
+        print_usage();
+        return 1;
+    }
+    if (pairs.size() > 1 && !options.diff_path.empty()) {
+        std::fprintf(stderr, "Error: --diff can only be used when comparing a single pair\n");
+        return 1;
+    }
+
+    // Pairs are independent, so decode and compare them concurrently. Hardware threads
+    // are split between pairs, and any left over go to each pair's pixel pass.
+    size_t hardware_threads = std::max(1u, std::thread::hardware_concurrency());
+    size_t pair_workers = std::min(hardware_threads, pairs.size());
+    size_t pixel_workers = std::max<size_t>(1, hardware_threads / pair_workers);
+
+    // A single pair keeps the plain output; batches prefix each line with the test path
+    std::vector<PairResult> results(pairs.size());
+    std::atomic<size_t> next_pair{0};
+    auto run_pairs = [&] {
+        for (size_t i = next_pair++; i < pairs.size(); i = next_pair++) {
+            std::string label = pairs.size() > 1 ? pairs[i].test_path + ": " : std::string();
+            results[i] = compare_pair(pairs[i], options, label.c_str(), pixel_workers);
+        }
+    };
+    std::vector<std::thread> workers;
+    for (size_t w = 1; w < pair_workers; ++w) {
+        workers.emplace_back(run_pairs);
+    }
+    run_pairs();
+    for (auto& worker : workers) {
+        worker.join();
+    }
+
+    bool all_passed = true;
+    for (const PairResult& result : results) {
+        std::fputs(result.errors.c_str(), stderr);
+        std::fputs(result.output.c_str(), stdout);
+        all_passed = all_passed && result.pass;
+    }
 
-    return pass ? 0 : 1;
+    return all_passed ? 0 : 1;
 }